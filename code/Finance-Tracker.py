@@ -7,41 +7,82 @@ Date: 2025/10/24
 """
 
 import os
+import re
+import math
 import json
+import mmap
+import bisect
 import logging
+import threading
 from abc import ABC, abstractmethod
 from datetime import datetime
-from typing import List, Dict, Any, Optional
-from dataclasses import dataclass, asdict
+from typing import List, Dict, Any, Optional, Tuple
+from dataclasses import dataclass
 import tkinter as tk
 from tkinter import ttk, messagebox, simpledialog, filedialog
 from tkcalendar import DateEntry
-import matplotlib.pyplot as plt
-from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg
-import matplotlib
-matplotlib.use('TkAgg')
 
-# ==================== matplotlib 中文支持 ====================
-from matplotlib.font_manager import FontProperties
 try:
-    # Windows 系统字体路径
-    font_path = 'C:/Windows/Fonts/simhei.ttf'
-    if os.path.exists(font_path):
-        custom_font = FontProperties(fname=font_path)
-        plt.rcParams['font.family'] = custom_font.get_name()
-    else:
-        # macOS 或 Linux 备选方案
-        plt.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'SimHei', 'Microsoft YaHei']
-    
-    plt.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
-except:
-    print("字体设置失败，可能需要手动安装中文字体")
+    import orjson  # 可选依赖：更快的 JSON 编解码
+except ImportError:
+    orjson = None
+
+# 可选依赖：向量化统计。numpy 导入耗时约 100ms，首次统计时才由 _load_numpy() 加载
+np = None
+_numpy_loaded = False
+
+def _load_numpy() -> None:
+    """尝试加载 numpy，只尝试一次；未安装时 np 保持 None，统计走纯 Python 分支"""
+    global np, _numpy_loaded
+    if _numpy_loaded:
+        return
+    _numpy_loaded = True
+    try:
+        import numpy
+    except ImportError:
+        return
+    np = numpy
+
+# ==================== matplotlib 中文支持 ====================
+
+# matplotlib 导入耗时较长，首次绘图时才由 _load_matplotlib() 加载
+plt = None
+FigureCanvasTkAgg = None
+
+def _load_matplotlib() -> None:
+    global plt, FigureCanvasTkAgg
+    if plt is not None:
+        return
+    
+    import matplotlib
+    matplotlib.use('TkAgg')
+    import matplotlib.pyplot as pyplot
+    from matplotlib.backends.backend_tkagg import FigureCanvasTkAgg as canvas_class
+    from matplotlib import font_manager
+    
+    try:
+        # Windows 系统字体路径
+        font_path = 'C:/Windows/Fonts/simhei.ttf'
+        if os.path.exists(font_path):
+            # 注册到全局字体管理器后按名称引用，字体文件只解析一次
+            font_manager.fontManager.addfont(font_path)
+            pyplot.rcParams['font.family'] = font_manager.get_font(font_path).family_name
+        else:
+            # macOS 或 Linux 备选方案
+            pyplot.rcParams['font.sans-serif'] = ['Arial Unicode MS', 'SimHei', 'Microsoft YaHei']
+        
+        pyplot.rcParams['axes.unicode_minus'] = False  # 解决负号显示问题
+    except:
+        print("字体设置失败，可能需要手动安装中文字体")
+    
+    plt = pyplot
+    FigureCanvasTkAgg = canvas_class
 
 
 
 # ==================== MODEL LAYER ====================
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Entry:
     """账目实体类"""
     type: str  # 修复：统一使用 'type' 而不是 'entry_type'
@@ -52,9 +93,27 @@ class Entry:
     invoice: Optional[Dict[str, str]] = None
     
     def to_dict(self) -> Dict[str, Any]:
-        return asdict(self)
+        return {
+            'type': self.type,
+            'amount': self.amount,
+            'currency': self.currency,
+            'category': self.category,
+            'date': self.date,
+            'invoice': self.invoice
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Entry':
+        return cls(
+            type=data.get('type', ''),
+            amount=data['amount'],
+            currency=data.get('currency', 'CNY'),
+            category=data['category'],
+            date=data['date'],
+            invoice=data.get('invoice')
+        )
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Plan:
     """资金计划实体类"""
     plan_type: str
@@ -64,14 +123,84 @@ class Plan:
     saving_goal: float
     
     def to_dict(self) -> Dict[str, Any]:
-        return asdict(self)
+        return {
+            'plan_type': self.plan_type,
+            'start_date': self.start_date,
+            'end_date': self.end_date,
+            'spending_limit': self.spending_limit,
+            'saving_goal': self.saving_goal
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Plan':
+        return cls(
+            plan_type=data['plan_type'],
+            start_date=data['start_date'],
+            end_date=data['end_date'],
+            spending_limit=data['spending_limit'],
+            saving_goal=data['saving_goal']
+        )
+
+def _encode_record(obj: Any) -> Dict[str, Any]:
+    """标准库 json 不认识 Entry/Plan，序列化时转换为 dict"""
+    if isinstance(obj, (Entry, Plan)):
+        return obj.to_dict()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+# 编码选项只构造一次；json.dumps 每次调用都会新建 JSONEncoder
+if orjson is not None:
+    _ORJSON_LINE = orjson.OPT_NON_STR_KEYS
+    _ORJSON_INDENT = orjson.OPT_NON_STR_KEYS | orjson.OPT_INDENT_2
+# orjson 会把 NaN/inf 静默写成 null，标准库也不允许写出非有限数，两者保持一致
+_JSON_LINE_ENCODER = json.JSONEncoder(ensure_ascii=False, allow_nan=False, default=_encode_record)
+_JSON_INDENT_ENCODER = json.JSONEncoder(indent=2, ensure_ascii=False, allow_nan=False, default=_encode_record)
+
+def _dump_bytes(data: Any, indent: bool = True) -> bytes:
+    """将数据序列化为 UTF-8 编码的 JSON 字节串，indent 为 False 时输出单行"""
+    if orjson is not None:
+        # orjson 原生支持 dataclass，无需先转换为 dict
+        return orjson.dumps(data, option=_ORJSON_INDENT if indent else _ORJSON_LINE)
+    encoder = _JSON_INDENT_ENCODER if indent else _JSON_LINE_ENCODER
+    return encoder.encode(data).encode('utf-8')
+
+def _load_bytes(raw: bytes) -> Any:
+    """解析 UTF-8 编码的 JSON 字节串（使用 orjson 时也接受 memoryview）"""
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw)
 
 class DataManager:
-    """数据管理类"""
+    """数据管理类
+    
+    修改操作先追加写入 <file_path>.log，累计 COMPACT_EVERY 条或调用
+    save_data() 时才重写完整的 JSON 快照并清空日志。
+    
+    快照中的 log_generation 与日志首行的代号对应；保存时代号加一，
+    因此快照替换后即使旧日志没能删除，重新加载时也会被识别并跳过。
+    """
+    
+    COMPACT_EVERY = 100
     
     def __init__(self, file_path: str = 'finance_data.json'):
         self.file_path = file_path
         self.logger = self._setup_logger()
+        self._log_file = None
+        self._pending_ops = 0
+        # 当前快照的代号，日志只对同一代号的快照有效
+        self._log_generation = 0
+        # 磁盘上的日志已被快照覆盖，下次写日志时需要清空重写
+        self._truncate_log = False
+        # 日志末尾残留不完整的记录且未能截掉，下次追加前需先补一个换行
+        self._log_torn = False
+        # 自上次 consume_changes() 以来新增/删除的账目下标，None 表示需要整体刷新
+        self._changes: Optional[Tuple[List[int], List[int]]] = None
+        # 按 (收支类型, 货币) 汇总的原币金额，新增账目时增量累加（与重建的累加顺序一致），
+        # 删除、加载、导入后置为 None 待重建
+        self._currency_sums = None
+        # 数据版本号，任何影响统计结果的修改都会递增
+        self._version = 0
+        # 内存数据是否有尚未写入快照的修改
+        self._dirty = False
         
         self.data = {
             'entries': [],
@@ -101,20 +230,50 @@ class DataManager:
         
         return logger
     
+    @staticmethod
+    def _migrate_legacy_fields(loaded_data: Dict[str, Any]) -> bool:
+        """修复：旧版本数据使用 entry_type 字段，统一转换为 type；返回是否有改动"""
+        migrated = False
+        for entry in loaded_data.get('entries', ()):
+            if 'entry_type' in entry:
+                entry['type'] = entry.pop('entry_type')
+                migrated = True
+        return migrated
+    
+    def _read_ledger(self, path: str) -> Tuple[Dict[str, Any], int, bool]:
+        """读取账本快照，返回 (数据, 日志代号, 是否迁移了旧字段)；账目和计划转换为 Entry/Plan 对象"""
+        with open(path, 'rb') as file:
+            if orjson is not None and os.fstat(file.fileno()).st_size:
+                # orjson 可直接解析映射的文件内容，省去一份完整的字节串拷贝
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped, \
+                        memoryview(mapped) as view:
+                    loaded_data = _load_bytes(view)
+            else:
+                loaded_data = _load_bytes(file.read())
+        generation = loaded_data.pop('log_generation', 0)
+        migrated = self._migrate_legacy_fields(loaded_data)
+        if 'entries' in loaded_data:
+            loaded_data['entries'] = [Entry.from_dict(entry) for entry in loaded_data['entries']]
+        if 'plans' in loaded_data:
+            loaded_data['plans'] = [Plan.from_dict(plan) for plan in loaded_data['plans']]
+        return loaded_data, generation, migrated
+    
     def load_data(self) -> bool:
+        self._changes = None
+        self._currency_sums = None
+        self._version += 1
+        self._dirty = False
         try:
-            if os.path.exists(self.file_path):
-                with open(self.file_path, 'r', encoding='utf-8') as file:
-                    loaded_data = json.load(file)
-                    
-                    # 修复：处理旧数据中的字段名问题
-                    if 'entries' in loaded_data:
-                        for entry in loaded_data['entries']:
-                            # 如果存在 entry_type 字段，转换为 type 字段
-                            if 'entry_type' in entry:
-                                entry['type'] = entry.pop('entry_type')
-                    
-                    self.data.update(loaded_data)
+            found = os.path.exists(self.file_path)
+            self._log_generation = 0
+            if found:
+                loaded_data, self._log_generation, _ = self._read_ledger(self.file_path)
+                self.data.update(loaded_data)
+            
+            # 快照之后的修改保存在日志中，需要重放
+            self._pending_ops = self._replay_log()
+            
+            if found or self._pending_ops:
                 self.logger.info(f"数据加载成功: {self.file_path}")
                 return True
             else:
@@ -125,13 +284,25 @@ class DataManager:
             return False
     
     def save_data(self) -> bool:
+        # 没有修改且快照已存在时无需重写
+        if not self._dirty and os.path.exists(self.file_path):
+            return True
         try:
-            directory = os.path.dirname(self.file_path)
-            if directory and not os.path.exists(directory):
-                os.makedirs(directory, exist_ok=True)
+            self._ensure_directory()
+            generation = self._log_generation + 1
+            self._write_atomic(_dump_bytes({**self.data, 'log_generation': generation}))
             
-            with open(self.file_path, 'w', encoding='utf-8') as file:
-                json.dump(self.data, file, indent=2, ensure_ascii=False)
+            # 快照已包含全部修改，旧日志作废；删除失败也无妨，代号不匹配会被跳过
+            self._log_generation = generation
+            self._close_log()
+            self._truncate_log = True
+            self._pending_ops = 0
+            self._dirty = False
+            try:
+                if os.path.exists(self._log_path()):
+                    os.remove(self._log_path())
+            except OSError as e:
+                self.logger.warning(f"旧日志删除失败: {str(e)}")
             
             self.logger.info(f"数据保存成功: {self.file_path}")
             return True
@@ -141,7 +312,10 @@ class DataManager:
     
     def save_as(self, new_file_path: str) -> bool:
         original_path = self.file_path
+        self._close_log()
         self.file_path = new_file_path
+        # 另存为总是写出新文件，即使目标路径已存在
+        self._dirty = True
         
         if self.save_data():
             return True
@@ -151,61 +325,303 @@ class DataManager:
     
     def import_data(self, import_file_path: str) -> bool:
         try:
-            with open(import_file_path, 'r', encoding='utf-8') as file:
-                imported_data = json.load(file)
-            
-            # 修复：导入时也处理字段名问题
-            if 'entries' in imported_data:
-                for entry in imported_data['entries']:
-                    if 'entry_type' in entry:
-                        entry['type'] = entry.pop('entry_type')
+            imported_data, generation, migrated = self._read_ledger(import_file_path)
+            # 导入文件缺少的字段沿用当前数据，合并结果需要写回
+            complete = all(key in imported_data for key in self.data)
             
             self.data.update(imported_data)
+            self._close_log()
             self.file_path = import_file_path
+            self._log_generation = generation
+            # 导入的文件本身已是完整快照时无需再全量重写一遍
+            self._dirty = migrated or not complete
+            self._pending_ops = self._replay_log()
+            self._changes = None
+            self._currency_sums = None
+            self._version += 1
             
-            if self.save_data():
-                self.logger.info(f"数据导入成功: {import_file_path}")
-                return True
-            return False
+            if not self.save_data():
+                return False
+            self.logger.info(f"数据导入成功: {import_file_path}")
+            return True
         except Exception as e:
             self.logger.error(f"数据导入失败: {str(e)}")
             return False
     
-    def add_entry(self, entry: Entry) -> None:
-        self.data['entries'].append(entry.to_dict())
+    def _ensure_directory(self) -> None:
+        directory = os.path.dirname(self.file_path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
     
-    def delete_entries(self, indices: List[int]) -> None:
-        for index in sorted(indices, reverse=True):
-            if 0 <= index < len(self.data['entries']):
-                del self.data['entries'][index]
+    def _write_atomic(self, payload: bytes) -> None:
+        """先完整写入临时文件并 fsync，再原子替换账本，写盘中途失败不会损坏原文件"""
+        tmp_path = self.file_path + '.tmp'
+        fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | getattr(os, 'O_BINARY', 0), 0o644)
+        try:
+            try:
+                view = memoryview(payload)
+                while view:
+                    view = view[os.write(fd, view):]
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            os.replace(tmp_path, self.file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    def _log_path(self) -> str:
+        return self.file_path + '.log'
+    
+    def _close_log(self) -> None:
+        if self._log_file is not None:
+            self._log_file.close()
+            self._log_file = None
+    
+    def _apply_op(self, op: Dict[str, Any]) -> None:
+        """将一条修改操作应用到内存数据"""
+        self._version += 1
+        self._dirty = True
+        kind = op['op']
+        if kind == 'add':
+            if self._currency_sums is not None:
+                self._add_to_sums(op['entry'])
+            self.data['entries'].append(op['entry'])
+            self._record_change(added=[len(self.data['entries']) - 1])
+        elif kind == 'delete':
+            self._record_change(removed=op['indices'])
+            # 一次遍历重建列表，避免逐个 del 带来的 O(k·N) 内存搬移
+            removed = set(op['indices'])
+            # 浮点数减法会累积误差，与重建结果不一致；删除后置空，下次统计时重建
+            self._currency_sums = None
+            self.data['entries'] = [
+                entry for index, entry in enumerate(self.data['entries'])
+                if index not in removed
+            ]
+        elif kind == 'budget':
+            self.data['budget'] = op['value']
+        elif kind == 'rates':
+            self.data['exchange_rates'] = op['rates']
+    
+    def _record_change(self, added: List[int] = (), removed: List[int] = ()) -> None:
+        if self._changes is None:
+            return
+        pending_added, pending_removed = self._changes
+        # 删除后的下标会整体平移，新增与删除混合时无法增量描述
+        if (added and pending_removed) or (removed and (pending_added or pending_removed)):
+            self._changes = None
+            return
+        pending_added.extend(added)
+        pending_removed.extend(removed)
+    
+    def consume_changes(self) -> Optional[Tuple[List[int], List[int]]]:
+        """返回并清空自上次调用以来的 (新增下标, 删除下标)，None 表示需要整体刷新"""
+        changes = self._changes
+        self._changes = ([], [])
+        return changes
+    
+    def _append_op(self, op: Dict[str, Any]) -> bool:
+        """应用修改并追加写入日志，累计 COMPACT_EVERY 条后重写快照"""
+        self._apply_op(op)
+        try:
+            if self._log_file is None:
+                self._ensure_directory()
+                self._log_file = open(self._log_path(), 'wb' if self._truncate_log else 'ab', buffering=0)
+                self._truncate_log = False
+                if self._log_torn:
+                    self._log_file.write(b'\n')
+                    self._log_torn = False
+                if self._log_file.tell() == 0:
+                    # 新日志首行记录对应的快照代号
+                    header = {'op': 'generation', 'value': self._log_generation}
+                    self._log_file.write(_dump_bytes(header, indent=False) + b'\n')
+            self._log_file.write(_dump_bytes(op, indent=False) + b'\n')
+        except Exception as e:
+            self.logger.error(f"日志写入失败: {str(e)}")
+            return False
+        
+        self._pending_ops += 1
+        if self._pending_ops >= self.COMPACT_EVERY:
+            return self.save_data()
+        return True
     
-    def get_entries(self) -> List[Dict[str, Any]]:
+    def _replay_log(self) -> int:
+        """重放日志中的修改操作，返回重放的条数"""
+        log_path = self._log_path()
+        self._truncate_log = False
+        self._log_torn = False
+        if not os.path.exists(log_path):
+            return 0
+        
+        count = 0
+        checked = False
+        # 最后一条以换行结尾的完整记录之后的偏移量
+        complete_end = 0
+        with open(log_path, 'rb') as file:
+            for line in file:
+                if not line.endswith(b'\n'):
+                    # 程序异常退出时最后一行可能写入不完整
+                    self.logger.warning(f"丢弃不完整的日志记录: {log_path}")
+                    break
+                complete_end += len(line)
+                if not line.strip():
+                    continue
+                try:
+                    op = _load_bytes(line)
+                except ValueError:
+                    self.logger.warning(f"跳过损坏的日志记录: {log_path}")
+                    continue
+                if not checked:
+                    checked = True
+                    # 旧版本的日志没有代号行，视为代号 0
+                    generation = op['value'] if op['op'] == 'generation' else 0
+                    if generation != self._log_generation:
+                        # 快照已包含这份日志（保存后删除日志失败），整份跳过
+                        self.logger.warning(f"跳过已合并到快照的日志: {log_path}")
+                        self._truncate_log = True
+                        return 0
+                if op['op'] == 'generation':
+                    continue
+                if op['op'] == 'add':
+                    op['entry'] = Entry.from_dict(op['entry'])
+                self._apply_op(op)
+                count += 1
+        
+        # 截掉残行，否则之后追加的记录会接在残行后面，整行无法解析
+        if os.path.getsize(log_path) > complete_end:
+            try:
+                os.truncate(log_path, complete_end)
+            except OSError as e:
+                self.logger.warning(f"日志截断失败: {str(e)}")
+                self._log_torn = True
+        return count
+    
+    def _check_finite(self, *values: float) -> bool:
+        """NaN/inf 无法写入 JSON（orjson 会变成 null），在进入数据前拒绝"""
+        if all(math.isfinite(value) for value in values):
+            return True
+        self.logger.error(f"拒绝非有限数值: {values}")
+        return False
+    
+    def add_entry(self, entry: Entry) -> bool:
+        if not self._check_finite(entry.amount):
+            return False
+        return self._append_op({'op': 'add', 'entry': entry})
+    
+    def delete_entries(self, indices: List[int]) -> bool:
+        count = len(self.data['entries'])
+        valid = sorted({index for index in indices if 0 <= index < count})
+        return self._append_op({'op': 'delete', 'indices': valid})
+    
+    def get_entries(self) -> List[Entry]:
         return self.data['entries']
     
-    def set_budget(self, budget: float) -> None:
-        self.data['budget'] = budget
+    def get_version(self) -> int:
+        return self._version
+    
+    def _rebuild_currency_sums(self) -> None:
+        """一次遍历按 (收支类型, 货币) 汇总原币金额，汇率在统计时再乘上"""
+        entries = self.data['entries']
+        count = len(entries)
+        currencies = sorted({entry.currency for entry in entries})
+        currency_codes = {currency: i for i, currency in enumerate(currencies)}
+        width = len(currencies)
+        
+        amounts = np.fromiter((entry.amount for entry in entries),
+                              dtype=np.float64, count=count)
+        # 第 0 行为收入，第 1 行为支出
+        buckets = np.fromiter(((0 if entry.type == 'income' else width) + currency_codes[entry.currency]
+                               for entry in entries),
+                              dtype=np.intp, count=count)
+        # 没有账目时 bincount 返回整数数组，需转为浮点，否则后续累加会被截断
+        sums = np.bincount(buckets, weights=amounts, minlength=2 * width).astype(np.float64, copy=False).reshape(2, width)
+        self._currency_sums = (sums, currencies)
+    
+    def _add_to_sums(self, entry: Entry) -> None:
+        """新增账目时累加到汇总，遇到新货币时按排序位置插入一列，与重建时的列顺序一致"""
+        sums, currencies = self._currency_sums
+        if entry.currency not in currencies:
+            position = bisect.bisect(currencies, entry.currency)
+            currencies.insert(position, entry.currency)
+            sums = np.insert(sums, position, 0.0, axis=1)
+            self._currency_sums = (sums, currencies)
+        row = 0 if entry.type == 'income' else 1
+        sums[row, currencies.index(entry.currency)] += entry.amount
+    
+    def sum_by_type(self) -> Tuple[float, float]:
+        """按当前汇率折算为 CNY，返回 (总收入, 总支出)"""
+        exchange_rates = self.get_exchange_rates()
+        
+        _load_numpy()
+        if np is None:
+            total_income = 0.0
+            total_expenses = 0.0
+            rate_of = exchange_rates.get
+            
+            for entry in self.data['entries']:
+                converted_amount = entry.amount * rate_of(entry.currency, 1.0)
+                
+                if entry.type == 'income':
+                    total_income += converted_amount
+                else:
+                    total_expenses += converted_amount
+            
+            return total_income, total_expenses
+        
+        if self._currency_sums is None:
+            self._rebuild_currency_sums()
+        sums, currencies = self._currency_sums
+        
+        # 汇率只作用于 2×货币数 的小矩阵，与账目数量无关
+        rate_lut = np.array([exchange_rates.get(currency, 1.0) for currency in currencies],
+                            dtype=np.float64)
+        total_income, total_expenses = sums @ rate_lut
+        return float(total_income), float(total_expenses)
+    
+    def set_budget(self, budget: float) -> bool:
+        if not self._check_finite(budget):
+            return False
+        return self._append_op({'op': 'budget', 'value': budget})
     
     def get_budget(self) -> float:
         return self.data.get('budget', 0.0)
     
-    def set_exchange_rates(self, rates: Dict[str, float]) -> None:
-        self.data['exchange_rates'] = rates
+    def set_exchange_rates(self, rates: Dict[str, float]) -> bool:
+        # 汇率未变时不写日志，也不使统计缓存失效
+        if rates == self.data.get('exchange_rates'):
+            return True
+        if not self._check_finite(*rates.values()):
+            return False
+        return self._append_op({'op': 'rates', 'rates': rates})
     
     def get_exchange_rates(self) -> Dict[str, float]:
         return self.data.get('exchange_rates', {})
     
     def add_plan(self, plan: Plan) -> None:
-        self.data['plans'].append(plan.to_dict())
+        self.data['plans'].append(plan)
+        self._dirty = True
     
     def delete_plan(self, index: int) -> None:
         if 0 <= index < len(self.data['plans']):
             del self.data['plans'][index]
+            self._dirty = True
     
-    def get_plans(self) -> List[Dict[str, Any]]:
+    def get_plans(self) -> List[Plan]:
+        """返回内部列表本身（不复制），调用方只读不改"""
         return self.data.get('plans', [])
 
 # ==================== VIEW LAYER ====================
 
+# 账目类型的显示文本，查表代替逐行 capitalize()
+_TYPE_LABELS = {'income': 'Income', 'expense': 'Expense', '': ''}
+_format_amount = '{:.2f}'.format
+_MSG = {
+    'info': messagebox.showinfo,
+    'warning': messagebox.showwarning,
+    'error': messagebox.showerror,
+}
+
 class BaseView(ABC):
     @abstractmethod
     def create_widgets(self):
@@ -241,12 +657,10 @@ class MainView(BaseView):
     
     def _create_variables(self):
         self.entry_type_var = tk.StringVar(value="Income")
-        self.amount_var = tk.DoubleVar(value=0.0)
         self.currency_var = tk.StringVar(value='CNY')
         self.category_var = tk.StringVar(value='Salary')
         self.invoice_type_var = tk.StringVar(value='none')
         self.invoice_desc_var = tk.StringVar()
-        self.budget_var = tk.DoubleVar(value=0.0)
     
     def create_widgets(self):
         self.root.columnconfigure(0, weight=1)
@@ -284,7 +698,10 @@ class MainView(BaseView):
         row += 1
         
         ttk.Label(frame, text="金额:").grid(row=row, column=0, sticky="w", pady=2)
-        ttk.Spinbox(frame, textvariable=self.amount_var, from_=0, to=float('inf'), increment=1).grid(row=row, column=1, sticky="ew", pady=2)
+        # 金额和预算只在提交时读取，直接读控件而不绑定 tk 变量
+        self.amount_spinbox = ttk.Spinbox(frame, from_=0, to=float('inf'), increment=1)
+        self.amount_spinbox.set(0.0)
+        self.amount_spinbox.grid(row=row, column=1, sticky="ew", pady=2)
         row += 1
         
         ttk.Label(frame, text="货币类型:").grid(row=row, column=0, sticky="w", pady=2)
@@ -320,7 +737,9 @@ class MainView(BaseView):
         row += 1
         
         ttk.Label(frame, text="月度预算:").grid(row=row, column=0, sticky="w", pady=2)
-        ttk.Spinbox(frame, textvariable=self.budget_var, from_=0, to=float('inf'), increment=100).grid(row=row, column=1, sticky="ew", pady=2)
+        self.budget_spinbox = ttk.Spinbox(frame, from_=0, to=float('inf'), increment=100)
+        self.budget_spinbox.set(0.0)
+        self.budget_spinbox.grid(row=row, column=1, sticky="ew", pady=2)
         row += 1
         
         ttk.Button(frame, text="设置预算", command=self.controller.set_budget).grid(row=row, column=0, columnspan=2, pady=5)
@@ -333,10 +752,11 @@ class MainView(BaseView):
         frame.rowconfigure(0, weight=1)
         frame.rowconfigure(1, weight=0)
         
-        self.fig, self.ax = plt.subplots(figsize=(6, 4), tight_layout=True)
-        self.canvas = FigureCanvasTkAgg(self.fig, master=frame)
-        self.canvas_widget = self.canvas.get_tk_widget()
-        self.canvas_widget.grid(row=0, column=0, sticky="nsew")
+        # 图表在首次统计时才创建，之前显示占位提示
+        self.chart_frame = frame
+        self.canvas = None
+        self.chart_placeholder = ttk.Label(frame, text="点击下方按钮生成统计图", anchor="center")
+        self.chart_placeholder.grid(row=0, column=0, sticky="nsew")
         
         button_frame = ttk.Frame(frame)
         button_frame.grid(row=1, column=0, pady=(10, 0))
@@ -363,6 +783,8 @@ class MainView(BaseView):
         
         columns = ("序号", "类型", "金额", "货币", "类别", "日期", "发票信息")
         self.treeview = ttk.Treeview(frame, columns=columns, show="headings", height=12)
+        # 当前显示的各行内容，刷新时与新数据比较
+        self._tree_rows = []
         
         for col in columns:
             self.treeview.heading(col, text=col)
@@ -388,7 +810,7 @@ class MainView(BaseView):
         entry_type = self.entry_type_var.get().lower()
         return {
             'type': entry_type,  # 修复：统一使用 'type'
-            'amount': self.amount_var.get(),
+            'amount': self.amount_spinbox.get(),
             'currency': self.currency_var.get(),
             'category': self.category_var.get(),
             'date': self.date_entry.get(),
@@ -398,91 +820,192 @@ class MainView(BaseView):
     
     def clear_entry_fields(self):
         self.entry_type_var.set("Income")
-        self.amount_var.set(0.0)
+        self.amount_spinbox.set(0.0)
         self.currency_var.set('CNY')
         self.category_var.set('Salary')
         self.date_entry.set_date(datetime.now())
         self.invoice_type_var.set('none')
         self.invoice_desc_var.set('')
     
+    def get_budget(self) -> float:
+        return float(self.budget_spinbox.get())
+    
+    def set_budget(self, budget: float):
+        self.budget_spinbox.set(budget)
+    
     def get_selected_entry_indices(self) -> List[int]:
         selected = self.treeview.selection()
         return [self.treeview.index(item) for item in selected]
     
-    def update_treeview(self, entries: List[Dict[str, Any]]):
-        self.treeview.delete(*self.treeview.get_children())
+    def _entry_values(self, i: int, entry: Entry) -> tuple:
+        invoice_info = entry.invoice
+        invoice_display = "无"
+        if invoice_info:
+            invoice_display = f"{invoice_info.get('type', '')}: {invoice_info.get('info', '')}"
+        
+        type_label = _TYPE_LABELS.get(entry.type)
+        if type_label is None:
+            type_label = entry.type.capitalize()
+        
+        return (
+            str(i + 1),
+            type_label,
+            _format_amount(entry.amount),
+            entry.currency,
+            entry.category,
+            entry.date,
+            invoice_display
+        )
+    
+    def update_treeview(self, entries: List[Entry],
+                        changes: Optional[Tuple[List[int], List[int]]] = None):
+        rows = self._tree_rows
         
-        for i, entry in enumerate(entries):
-            invoice_info = entry.get('invoice', {})
-            invoice_display = "无"
-            if invoice_info:
-                invoice_display = f"{invoice_info.get('type', '')}: {invoice_info.get('info', '')}"
-            
-            # 修复：统一使用 'type' 字段
-            entry_type = entry.get('type', '')
-            if not entry_type and 'entry_type' in entry:
-                entry_type = entry['entry_type']  # 向后兼容
-            
-            values = (
-                f"{i + 1}",
-                entry_type.capitalize() if entry_type else '',
-                f"{entry['amount']:.2f}",
-                entry.get('currency', 'CNY'),
-                entry['category'],
-                entry['date'],
-                invoice_display
-            )
-            self.treeview.insert("", "end", values=values)
+        # 只有新增账目时直接在末尾追加新行
+        if changes is not None and not changes[1] and len(rows) + len(changes[0]) == len(entries):
+            for i in changes[0]:
+                values = self._entry_values(i, entries[i])
+                self.treeview.insert("", "end", values=values)
+                rows.append(values)
+            return
+        
+        children = self.treeview.get_children()
+        new_rows = [self._entry_values(i, entry) for i, entry in enumerate(entries)]
+        
+        # 与当前显示的行逐行比较，只改动有变化的行；期间先把表格移出布局，避免逐行触发重绘
+        self.treeview.grid_remove()
+        try:
+            shifted = False
+            for child, old_values, values in zip(children, rows, new_rows):
+                if old_values != values:
+                    self.treeview.item(child, values=values)
+                    shifted = True
+            if len(children) > len(new_rows):
+                self.treeview.delete(*children[len(new_rows):])
+                shifted = True
+            # 行内容按位置改写后，选中的行已对应别的账目，需要清除选择以免误删
+            if shifted:
+                self.treeview.selection_remove(self.treeview.selection())
+            for values in new_rows[len(children):]:
+                self.treeview.insert("", "end", values=values)
+        finally:
+            self.treeview.grid()
+        self._tree_rows = new_rows
+    
+    def _ensure_chart(self):
+        if self.canvas is not None:
+            return
+        
+        _load_matplotlib()
+        self.fig, self.ax = plt.subplots(figsize=(6, 4), tight_layout=True)
+        # 条形图的柱子和数值标注，类别不变时直接复用
+        self._bar_artists = None
+        self._bar_labels = None
+        self._bar_categories = None
+        # 饼图的 (扇区, 标签, 百分比) 图元，类别不变时直接复用
+        self._pie_artists = None
+        self._pie_categories = None
+        self.canvas = FigureCanvasTkAgg(self.fig, master=self.chart_frame)
+        self.canvas_widget = self.canvas.get_tk_widget()
+        self.chart_placeholder.destroy()
+        self.canvas_widget.grid(row=0, column=0, sticky="nsew")
     
-    def update_chart(self, chart_type: str, data: Dict[str, Any]):
+    def _update_bar_chart(self, data: Dict[str, Any]):
+        categories = list(data.keys())
+        values = list(data.values())
+        
+        labels = [f'{value:.2f}' for value in values]
+        
+        if self._bar_artists is not None and self._bar_categories == categories:
+            # 类别未变：只更新柱高和标注，避免 clear() 后重建全部图元
+            for bar, value in zip(self._bar_artists, values):
+                bar.set_height(value)
+            # bar_label 按 datavalues 的正负决定标注在柱顶还是柱底
+            self._bar_artists.datavalues = values
+            for label in self._bar_labels:
+                label.remove()
+            self._bar_labels = self.ax.bar_label(self._bar_artists, labels=labels, padding=3)
+            self.ax.relim()
+            self.ax.autoscale_view()
+            return
+        
+        self.ax.clear()
+        self._pie_artists = None
+        colors = ['green', 'red', 'purple', 'blue'][:len(categories)]
+        
+        bars = self.ax.bar(categories, values, color=colors)
+        self.ax.set_ylabel('金额 (CNY)')
+        self.ax.set_title('财务统计')
+        
+        self._bar_labels = self.ax.bar_label(bars, labels=labels, padding=3)
+        self._bar_artists = bars
+        self._bar_categories = categories
+    
+    def _update_pie_chart(self, data: Dict[str, Any]):
+        filtered_data = {k: v for k, v in data.items() if v > 0}
+        categories = list(filtered_data.keys())
+        values = list(filtered_data.values())
+        
+        if self._pie_artists is not None and self._pie_categories == categories:
+            # 类别未变：按 ax.pie 的布局重新计算扇区角度和文字位置
+            wedges, texts, autotexts = self._pie_artists
+            total = sum(values)
+            theta1 = 90.0
+            for wedge, text, autotext, value in zip(wedges, texts, autotexts, values):
+                frac = value / total
+                theta2 = theta1 + 360.0 * frac
+                thetam = math.radians((theta1 + theta2) / 2)
+                wedge.set_theta1(theta1)
+                wedge.set_theta2(theta2)
+                xt, yt = math.cos(thetam), math.sin(thetam)
+                text.set_position((1.1 * xt, 1.1 * yt))
+                text.set_horizontalalignment('left' if xt > 0 else 'right')
+                autotext.set_position((0.6 * xt, 0.6 * yt))
+                autotext.set_text(f'{100 * frac:.1f}%')
+                theta1 = theta2
+            return
+        
         self.ax.clear()
+        self._bar_artists = None
+        self._pie_artists = None
+        self._pie_categories = None
+        if not filtered_data:
+            self.ax.text(0.5, 0.5, '暂无数据', ha='center', va='center', 
+                       transform=self.ax.transAxes, fontsize=12)
+            self.ax.set_title('收入/支出占比')
+            return
+        
+        colors = ['#4CAF50', '#F44336', '#FF9800', '#2196F3'][:len(categories)]
+        
+        wedges, texts, autotexts = self.ax.pie(
+            values, 
+            labels=categories, 
+            autopct='%1.1f%%',
+            colors=colors,
+            startangle=90
+        )
+        self.ax.set_title('收入/支出占比')
+        
+        for autotext in autotexts:
+            autotext.set_color('white')
+            autotext.set_fontweight('bold')
+        
+        self._pie_artists = (wedges, texts, autotexts)
+        self._pie_categories = categories
+    
+    def update_chart(self, chart_type: str, data: Dict[str, Any]):
+        self._ensure_chart()
         
         if chart_type == 'bar':
-            categories = list(data.keys())
-            values = list(data.values())
-            colors = ['green', 'red', 'purple', 'blue'][:len(categories)]
-            
-            bars = self.ax.bar(categories, values, color=colors)
-            self.ax.set_ylabel('金额 (CNY)')
-            self.ax.set_title('财务统计')
-            
-            for bar, value in zip(bars, values):
-                self.ax.text(bar.get_x() + bar.get_width()/2, bar.get_height(), 
-                           f'{value:.2f}', ha='center', va='bottom')
+            self._update_bar_chart(data)
             
         elif chart_type == 'pie':
-            filtered_data = {k: v for k, v in data.items() if v > 0}
-            if not filtered_data:
-                self.ax.text(0.5, 0.5, '暂无数据', ha='center', va='center', 
-                           transform=self.ax.transAxes, fontsize=12)
-                self.ax.set_title('收入/支出占比')
-            else:
-                categories = list(filtered_data.keys())
-                values = list(filtered_data.values())
-                colors = ['#4CAF50', '#F44336', '#FF9800', '#2196F3'][:len(categories)]
-                
-                wedges, texts, autotexts = self.ax.pie(
-                    values, 
-                    labels=categories, 
-                    autopct='%1.1f%%',
-                    colors=colors,
-                    startangle=90
-                )
-                self.ax.set_title('收入/支出占比')
-                
-                for autotext in autotexts:
-                    autotext.set_color('white')
-                    autotext.set_fontweight('bold')
+            self._update_pie_chart(data)
         
-        self.canvas.draw()
+        self.canvas.draw_idle()
     
     def show_message(self, title: str, message: str, message_type: str = "info"):
-        if message_type == "info":
-            messagebox.showinfo(title, message)
-        elif message_type == "warning":
-            messagebox.showwarning(title, message)
-        elif message_type == "error":
-            messagebox.showerror(title, message)
+        _MSG.get(message_type, messagebox.showinfo)(title, message)
     
     def ask_confirmation(self, title: str, message: str) -> bool:
         return messagebox.askyesno(title, message)
@@ -509,7 +1032,7 @@ class ExchangeRateView:
         self.window.transient(parent)
         self.window.grab_set()
         
-        self.rate_vars = {}
+        self.rate_entries = {}
         self.create_widgets()
     
     def create_widgets(self):
@@ -522,9 +1045,9 @@ class ExchangeRateView:
         
         for currency in currencies:
             ttk.Label(self.window, text=f"{currency}:").grid(row=row, column=0, sticky="w", pady=2)
-            rate_var = tk.DoubleVar()
-            ttk.Entry(self.window, textvariable=rate_var).grid(row=row, column=1, sticky="ew", pady=2)
-            self.rate_vars[currency] = rate_var
+            rate_entry = ttk.Entry(self.window)
+            rate_entry.grid(row=row, column=1, sticky="ew", pady=2)
+            self.rate_entries[currency] = rate_entry
             row += 1
         
         button_frame = ttk.Frame(self.window)
@@ -535,11 +1058,19 @@ class ExchangeRateView:
     
     def set_rates(self, rates: Dict[str, float]):
         for currency, rate in rates.items():
-            if currency in self.rate_vars:
-                self.rate_vars[currency].set(rate)
+            if currency in self.rate_entries:
+                self.rate_entries[currency].delete(0, "end")
+                self.rate_entries[currency].insert(0, str(rate))
     
     def get_rates(self) -> Dict[str, float]:
-        return {currency: var.get() for currency, var in self.rate_vars.items()}
+        """读取并转换汇率，无法转换时抛出带货币名的 ValueError"""
+        rates = {}
+        for currency, rate_entry in self.rate_entries.items():
+            try:
+                rates[currency] = float(rate_entry.get())
+            except ValueError:
+                raise ValueError(f"{currency}汇率不是有效数字") from None
+        return rates
     
     def close(self):
         self.window.destroy()
@@ -624,18 +1155,25 @@ class PlanView:
         self.spending_limit_var.set(0.0)
         self.saving_goal_var.set(0.0)
     
-    def update_plans(self, plans: List[Dict[str, Any]]):
+    @staticmethod
+    def _plan_values(plan: Plan) -> tuple:
+        return (
+            plan.plan_type,
+            plan.start_date,
+            plan.end_date,
+            f"{plan.spending_limit:.2f}",
+            f"{plan.saving_goal:.2f}"
+        )
+    
+    def update_plans(self, plans: List[Plan]):
         self.treeview.delete(*self.treeview.get_children())
         
         for plan in plans:
-            values = (
-                plan['plan_type'],
-                plan['start_date'],
-                plan['end_date'],
-                f"{plan['spending_limit']:.2f}",
-                f"{plan['saving_goal']:.2f}"
-            )
-            self.treeview.insert("", "end", values=values)
+            self.treeview.insert("", "end", values=self._plan_values(plan))
+    
+    def append_plan_row(self, plan: Plan):
+        """新增计划只追加一行，不重绘整个列表"""
+        self.treeview.insert("", "end", values=self._plan_values(plan))
     
     def get_selected_plan_index(self) -> int:
         selected = self.treeview.selection()
@@ -648,10 +1186,20 @@ class PlanView:
 
 # ==================== CONTROLLER LAYER ====================
 
+# YYYY-MM-DD，月份 01-12、日期 01-31；正则匹配比 strptime 快得多
+_is_valid_date = re.compile(r'\d{4}-(0[1-9]|1[0-2])-(0[1-9]|[12]\d|3[01])').fullmatch
+
 class FinanceController:
     def __init__(self):
         self.root = tk.Tk()
         self.data_manager = DataManager()
+        self._update_pending = False
+        self._plans_refresh_pending = False
+        self._quitting = False
+        # 计划修改后延迟写盘，短时间内的多次修改合并为一次
+        self._flush_scheduled = False
+        # (数据版本号, 统计结果)，版本号不变时直接复用
+        self._totals_cache = None
         
         # 创建视图时传入控制器实例
         self.main_view = MainView(self.root, self)
@@ -689,9 +1237,8 @@ class FinanceController:
                 invoice=invoice_data
             )
             
-            self.data_manager.add_entry(entry)
-            if self.data_manager.save_data():
-                self.update_display()
+            if self.data_manager.add_entry(entry):
+                self._schedule_update()
                 self.main_view.clear_entry_fields()
                 self.main_view.show_message("成功", "账目记录成功")
             else:
@@ -709,6 +1256,10 @@ class FinanceController:
     def _validate_entry_data(self, data: Dict[str, Any]) -> bool:
         try:
             amount = float(data['amount'])
+            # Spinbox 的 float() 会接受 "nan"/"inf"，需单独拦下
+            if not math.isfinite(amount):
+                self.main_view.show_message("错误", "金额必须是有效数字", "error")
+                return False
             if amount <= 0:
                 self.main_view.show_message("错误", "金额必须大于0", "error")
                 return False
@@ -716,9 +1267,7 @@ class FinanceController:
             self.main_view.show_message("错误", "金额必须是有效数字", "error")
             return False
         
-        try:
-            datetime.strptime(data['date'], '%Y-%m-%d')
-        except ValueError:
+        if not _is_valid_date(data['date']):
             self.main_view.show_message("错误", "日期格式必须为 YYYY-MM-DD", "error")
             return False
         
@@ -741,22 +1290,23 @@ class FinanceController:
             return
         
         if self.main_view.ask_confirmation("确认删除", "确定要删除选中的账目吗？"):
-            self.data_manager.delete_entries(indices)
-            if self.data_manager.save_data():
-                self.update_display()
+            if self.data_manager.delete_entries(indices):
+                self._schedule_update()
                 self.main_view.show_message("成功", "账目删除成功")
             else:
                 self.main_view.show_message("错误", "删除失败", "error")
     
     def set_budget(self):
         try:
-            budget = self.main_view.budget_var.get()
+            budget = self.main_view.get_budget()
+            if not math.isfinite(budget):
+                self.main_view.show_message("错误", "请输入有效的预算金额", "error")
+                return
             if budget < 0:
                 self.main_view.show_message("错误", "预算不能为负数", "error")
                 return
             
-            self.data_manager.set_budget(budget)
-            if self.data_manager.save_data():
+            if self.data_manager.set_budget(budget):
                 self.main_view.show_message("成功", "预算设置成功")
             else:
                 self.main_view.show_message("错误", "保存失败", "error")
@@ -768,8 +1318,10 @@ class FinanceController:
         file_path = self.main_view.browse_file("选择要导入的账本文件", [("JSON files", "*.json")])
         
         if file_path:
+            # 导入会切换账本文件，先把当前账本未保存的修改写盘
+            self._flush()
             if self.data_manager.import_data(file_path):
-                self.update_display()
+                self._schedule_update()
                 self.main_view.show_message("成功", "数据导入成功")
             else:
                 self.main_view.show_message("错误", "数据导入失败", "error")
@@ -778,6 +1330,7 @@ class FinanceController:
         file_path = self.main_view.save_file("另存为", [("JSON files", "*.json")])
         
         if file_path:
+            self._flush()
             if self.data_manager.save_as(file_path):
                 self.main_view.show_message("成功", f"账本已保存到: {file_path}")
             else:
@@ -797,24 +1350,24 @@ class FinanceController:
     def save_exchange_rates(self):
         try:
             new_rates = self.rate_view.get_rates()
-            
-            for currency, rate in new_rates.items():
-                if rate <= 0:
-                    self.main_view.show_message("错误", f"{currency}汇率必须大于0", "error")
-                    return
-            
-            current_rates = self.data_manager.get_exchange_rates()
-            current_rates.update(new_rates)
-            self.data_manager.set_exchange_rates(current_rates)
-            
-            if self.data_manager.save_data():
-                self.rate_view.close()
-                self.main_view.show_message("成功", "汇率更新成功")
-            else:
-                self.main_view.show_message("错误", "保存失败", "error")
-            
-        except ValueError:
-            self.main_view.show_message("错误", "请输入有效的汇率数字", "error")
+        except ValueError as e:
+            self.main_view.show_message("错误", str(e), "error")
+            return
+        
+        # 同时拦下 NaN 和 inf，二者都无法写入 JSON
+        bad = next((currency for currency, rate in new_rates.items()
+                    if not (math.isfinite(rate) and rate > 0)), None)
+        if bad is not None:
+            self.main_view.show_message("错误", f"{bad}汇率必须大于0", "error")
+            return
+        
+        # 合并成新字典，不能原地修改 DataManager 内部的汇率表
+        merged_rates = {**self.data_manager.get_exchange_rates(), **new_rates}
+        if self.data_manager.set_exchange_rates(merged_rates):
+            self.rate_view.close()
+            self.main_view.show_message("成功", "汇率更新成功")
+        else:
+            self.main_view.show_message("错误", "保存失败", "error")
     
     def manage_plans(self):
         self.plan_view = PlanView(self.root, self)
@@ -828,6 +1381,9 @@ class FinanceController:
             if data['spending_limit'] < 0 or data['saving_goal'] < 0:
                 self.main_view.show_message("错误", "花费限额和省钱目标不能为负数", "error")
                 return
+            if not (math.isfinite(data['spending_limit']) and math.isfinite(data['saving_goal'])):
+                self.main_view.show_message("错误", "请输入有效的数字", "error")
+                return
             
             plan = Plan(
                 plan_type=data['plan_type'],
@@ -838,13 +1394,10 @@ class FinanceController:
             )
             
             self.data_manager.add_plan(plan)
-            if self.data_manager.save_data():
-                current_plans = self.data_manager.get_plans()
-                self.plan_view.update_plans(current_plans)
-                self.plan_view.clear_form()
-                self.main_view.show_message("成功", "计划添加成功")
-            else:
-                self.main_view.show_message("错误", "保存失败", "error")
+            self._schedule_save()
+            self.plan_view.append_plan_row(plan)
+            self.plan_view.clear_form()
+            self.main_view.show_message("成功", "计划添加成功")
             
         except ValueError:
             self.main_view.show_message("错误", "请输入有效的数字", "error")
@@ -858,12 +1411,9 @@ class FinanceController:
         
         if self.main_view.ask_confirmation("确认删除", "确定要删除选中的计划吗？"):
             self.data_manager.delete_plan(index)
-            if self.data_manager.save_data():
-                current_plans = self.data_manager.get_plans()
-                self.plan_view.update_plans(current_plans)
-                self.main_view.show_message("成功", "计划删除成功")
-            else:
-                self.main_view.show_message("错误", "删除失败", "error")
+            self._schedule_save()
+            self._schedule_plans_refresh()
+            self.main_view.show_message("成功", "计划删除成功")
     
     def browse_invoice_file(self):
         invoice_type = self.main_view.invoice_type_var.get()
@@ -895,65 +1445,95 @@ class FinanceController:
     def pie_analytics(self):
         try:
             totals = self.calculate_totals()
+            net_income = totals['net_income']
             
+            # 一次性构造字典，避免先建后插
+            extra = {'赤字': -net_income} if net_income < 0 else ({'结余': net_income} if net_income > 0 else {})
             data = {
                 '收入': totals['total_income'],
-                '支出': totals['total_expenses']
+                '支出': totals['total_expenses'],
+                **extra
             }
             
-            if totals['net_income'] < 0:
-                data['赤字'] = abs(totals['net_income'])
-            elif totals['net_income'] > 0:
-                data['结余'] = totals['net_income']
-            
             self.main_view.update_chart('pie', data)
         except Exception as e:
             self.main_view.show_message("错误", f"生成饼状图失败: {str(e)}", "error")
     
     def calculate_totals(self) -> Dict[str, float]:
-        entries = self.data_manager.get_entries()
-        exchange_rates = self.data_manager.get_exchange_rates()
-        budget = self.data_manager.get_budget()
+        version = self.data_manager.get_version()
+        if self._totals_cache is not None and self._totals_cache[0] == version:
+            return self._totals_cache[1]
         
-        total_income = 0.0
-        total_expenses = 0.0
-        
-        for entry in entries:
-            amount = entry['amount']
-            currency = entry.get('currency', 'CNY')
-            
-            rate = exchange_rates.get(currency, 1.0)
-            converted_amount = amount * rate
-            
-
-            entry_type = entry.get('type', '')
-            if not entry_type and 'entry_type' in entry:
-                entry_type = entry['entry_type']
-            
-            if entry_type == 'income':
-                total_income += converted_amount
-            else:
-                total_expenses += converted_amount
+        budget = self.data_manager.get_budget()
+        total_income, total_expenses = self.data_manager.sum_by_type()
         
         net_income = total_income - total_expenses - budget
         
-        return {
+        totals = {
             'total_income': total_income,
             'total_expenses': total_expenses,
             'budget': budget,
             'net_income': net_income
         }
+        self._totals_cache = (version, totals)
+        return totals
+    
+    def _schedule_save(self):
+        """500ms 后统一写盘，期间的多次修改只保存一次"""
+        if not self._flush_scheduled:
+            self._flush_scheduled = True
+            self.root.after(500, self._flush)
+    
+    def _flush(self):
+        self._flush_scheduled = False
+        # 没有未保存的修改时 save_data() 直接返回
+        if not self.data_manager.save_data():
+            self.main_view.show_message("错误", "保存失败", "error")
+    
+    def _schedule_plans_refresh(self):
+        """在事件循环空闲时刷新计划列表，连续的增删只重绘一次"""
+        if self._plans_refresh_pending:
+            return
+        self._plans_refresh_pending = True
+        self.root.after_idle(self._do_plans_refresh)
+    
+    def _do_plans_refresh(self):
+        self._plans_refresh_pending = False
+        # 计划窗口可能已在刷新前关闭
+        if self.plan_view.window.winfo_exists():
+            self.plan_view.update_plans(self.data_manager.get_plans())
+    
+    def _schedule_update(self):
+        """在事件循环空闲时刷新界面，同一轮内的多次修改只刷新一次"""
+        if self._update_pending:
+            return
+        self._update_pending = True
+        self.root.after_idle(self._flush_update)
+    
+    def _flush_update(self):
+        self._update_pending = False
+        self.update_display()
     
     def update_display(self):
         entries = self.data_manager.get_entries()
-        self.main_view.update_treeview(entries)
+        self.main_view.update_treeview(entries, self.data_manager.consume_changes())
         
         budget = self.data_manager.get_budget()
-        self.main_view.budget_var.set(budget)
+        self.main_view.set_budget(budget)
     
     def quit_app(self):
+        if self._quitting:
+            return
         if self.main_view.ask_confirmation("确认退出", "是否保存并退出？"):
-            self.data_manager.save_data()
+            self._quitting = True
+            # 先隐藏窗口，最终保存放到后台线程，界面立即消失
+            self.root.withdraw()
+            # join() 会阻塞事件循环，先把隐藏窗口的请求提交给窗口系统
+            self.root.update_idletasks()
+            # 非守护线程：超时后解释器退出前仍会等它写完，不会丢数据
+            saver = threading.Thread(target=self.data_manager.save_data, name="final-save")
+            saver.start()
+            saver.join(timeout=5.0)
             self.root.quit()
             self.root.destroy()
 